@@ -1,23 +1,79 @@
 import os
-from flask import Flask, render_template, request
+import uuid
+from concurrent.futures import ProcessPoolExecutor
+
+import click
+from flask import Flask, render_template, request, jsonify
 from flask_sqlalchemy import SQLAlchemy
 from werkzeug.utils import secure_filename
 from datetime import datetime
-from config import seed_database
+from config import seed_database, configure_database, upgrade_schema
 
 from models import db, CaseReport, PhageMatch, Bacteria, Phages, Manufacturers, BacteriaPhages, PhagesManufacturers
 from matcher.matcher import Matcher
+from matcher.errors import BlastError, BlastTimeout, BlastCancelled
+from matcher.deadline import JobRegistry
+from matcher.pipeline import AnalysisPipeline, ResistanceScreener
+from matcher.hit_archive import write_hit_archive, rescore_archive
+from matcher.digest_index import build_digest_index, load_digest_index
+from reports.case_history import (
+    InvalidCursor, list_cases, serialize_case, record_case_rollups, rebuild_case_rollups,
+    organism_weekly_summary, phage_recommendation_summary
+)
+from matcher.scheduler import BlastScheduler, SchedulerBusy, MB
 
 app = Flask(__name__)
-app.config['SQLALCHEMY_DATABASE_URI'] = 'sqlite:///app.db'
 app.config['SQLALCHEMY_TRACK_MODIFICATIONS'] = False
 app.config['UPLOAD_FOLDER'] = 'uploads'
+app.config['BLAST_STATE_DIR'] = os.environ.get('BLAST_STATE_DIR', app.instance_path)
+app.config['BLAST_CPU_SLOTS'] = int(os.environ.get('BLAST_CPU_SLOTS', os.cpu_count() or 1))
+app.config['BLAST_THREADS_PER_SEARCH'] = int(os.environ.get('BLAST_THREADS_PER_SEARCH', 1))
+app.config['BLAST_MEMORY_BUDGET_MB'] = int(os.environ.get('BLAST_MEMORY_BUDGET_MB', 4096))
+app.config['BLAST_MAX_QUEUE'] = int(os.environ.get('BLAST_MAX_QUEUE', 8))
+app.config['BLAST_QUEUE_TIMEOUT'] = float(os.environ.get('BLAST_QUEUE_TIMEOUT', 60))
+app.config['BLAST_NICE'] = int(os.environ.get('BLAST_NICE', 10))
+app.config['MATCH_TIMEOUT'] = float(os.environ.get('MATCH_TIMEOUT', 300))
+app.config['MATCH_ALLOW_PARTIAL'] = os.environ.get('MATCH_ALLOW_PARTIAL', '0') == '1'
+app.config['RESISTANCE_DB'] = os.environ.get('RESISTANCE_DB', 'data/resistance_blst/resistance')
+app.config['HIT_ARCHIVE_DIR'] = os.environ.get('HIT_ARCHIVE_DIR', 'data/hit_archive')
+configure_database(app)
 
 db.init_app(app)
 
+blast_scheduler = BlastScheduler(
+    state_dir=app.config['BLAST_STATE_DIR'],
+    cpu_slots=app.config['BLAST_CPU_SLOTS'],
+    threads_per_search=app.config['BLAST_THREADS_PER_SEARCH'],
+    memory_budget=app.config['BLAST_MEMORY_BUDGET_MB'] * MB,
+    max_queue=app.config['BLAST_MAX_QUEUE'],
+    queue_timeout=app.config['BLAST_QUEUE_TIMEOUT'],
+    nice=app.config['BLAST_NICE'],
+)
+job_registry = JobRegistry(
+    os.path.join(app.config['BLAST_STATE_DIR'], 'jobs'),
+    max_age=app.config['MATCH_TIMEOUT'] + app.config['BLAST_QUEUE_TIMEOUT'] + 60
+)
+
+
+def request_deadline(job_id):
+    """
+    Build the match deadline for the current request. Clients may shorten (but
+    not extend) MATCH_TIMEOUT with an X-Request-Timeout header or a ``timeout``
+    form field, and cancel the run via /jobs/<job_id>/cancel.
+    """
+    timeout = app.config['MATCH_TIMEOUT']
+    requested = request.headers.get('X-Request-Timeout') or request.form.get('timeout')
+    if requested:
+        try:
+            timeout = min(timeout, max(0.0, float(requested)))
+        except ValueError:
+            pass
+    return job_registry.deadline_for(job_id, timeout)
+
 
 with app.app_context():
     db.create_all()
+    upgrade_schema()
 
 
 @app.route("/", methods=["GET", "POST"])
@@ -33,13 +89,61 @@ def upload():
         except ValueError:
             threshold = 96.2
 
-        matcher = Matcher(ref_db='data/bacteria_blst/blst', high_prob_threshold=threshold)
-        exact, matches = matcher.match(filepath)
+        job_id = request.form.get("job_id") or request.headers.get("X-Job-Id")
+        if not JobRegistry.is_valid_job_id(job_id):
+            job_id = uuid.uuid4().hex
+        if not job_registry.start(job_id):
+            return render_template("home.html", error="A job with this id is already running."), 409
+        allow_partial = request.form.get("allow_partial", "1" if app.config['MATCH_ALLOW_PARTIAL'] else "0") == "1"
+
+        ref_db = 'data/bacteria_blst/blst'
+        matcher = Matcher(ref_db=ref_db, high_prob_threshold=threshold,
+                          scheduler=blast_scheduler, allow_partial=allow_partial,
+                          digest_index=load_digest_index(ref_db))
+        resistance_screener = None
+        if ResistanceScreener.is_available(app.config['RESISTANCE_DB']):
+            resistance_screener = ResistanceScreener(app.config['RESISTANCE_DB'], scheduler=blast_scheduler)
+        pipeline = AnalysisPipeline(matcher, resistance_screener)
+        try:
+            analysis = pipeline.run(filepath, request_deadline(job_id))
+        except SchedulerBusy as exc:
+            return (
+                render_template("home.html", error="The server is busy processing other sequences. Please retry shortly."),
+                429,
+                {"Retry-After": str(exc.retry_after)}
+            )
+        except BlastCancelled:
+            return render_template("home.html", error="The match job was cancelled."), 409
+        except BlastTimeout:
+            return render_template("home.html", error="Sequence matching took too long and was stopped."), 504
+        except BlastError as exc:
+            app.logger.error("BLAST failed for %s: %s", filename, exc)
+            return render_template("home.html", error="Sequence matching failed. Please try again later."), 502
+        finally:
+            job_registry.clear(job_id)
+
+        app.logger.info(
+            "Analysis of %s took %.2fs (%s)", filename, analysis.wall_time,
+            ", ".join(f"{name}={elapsed:.2f}s" for name, elapsed in analysis.timings.items())
+        )
+        for stage, error in analysis.errors.items():
+            app.logger.warning("Analysis stage %s failed for %s: %s", stage, filename, error)
+        exact, matches = analysis.results["species"]
+        stats = analysis.results.get("stats")
+        resistance_genes = analysis.results.get("resistance")
+        if resistance_genes is None:
+            resistance = "Not screened"
+        else:
+            resistance = ", ".join(resistance_genes) or "None detected"
+            if len(resistance) > 50:
+                resistance = resistance[:47] + "..."
+
         if not matches:
             return render_template(
                 "result.html",
                 report=None,
                 no_match=True,
+                partial=matcher.partial,
                 uploaded_filename=filename
     )
 
@@ -53,8 +157,8 @@ def upload():
         bacteria = Bacteria.query.filter_by(bacteria_id=match_id).first()
         bacteria_info = {
             "name": bacteria.name if bacteria else "N/A",
-            "ncbi_id": bacteria.ncbi_id or "N/A",
-            "tax_id": bacteria.tax_id or "N/A"
+            "ncbi_id": (bacteria.ncbi_id if bacteria else None) or "N/A",
+            "tax_id": (bacteria.tax_id if bacteria else None) or "N/A"
         }
 
         # ✅ Main match phages
@@ -98,10 +202,10 @@ def upload():
             user_id=1,
             uploaded_file_name=filename,
             specimen_number="N/A",
-            genome_length="N/A",
+            genome_length=str(stats["genome_length"]) if stats else "N/A",
             name=bacteria.name if bacteria else "Unknown",
-            gc_content="N/A",
-            resistance="Unknown",
+            gc_content=f"{stats['gc_content']:.2f}%" if stats else "N/A",
+            resistance=resistance,
             severity="Unknown",
             background="Auto-generated",
             most_effective_phage=phage_info_list[0]["name"] if phage_info_list else "None",
@@ -120,6 +224,18 @@ def upload():
             ph.case_report_id = case.id
             db.session.add(ph)
 
+        # 🗄️ Keep the raw hits so the case can be re-scored without re-running BLAST
+        if matcher.hits is not None:
+            archive_path = os.path.join(app.config['HIT_ARCHIVE_DIR'], f"case_{case.id}")
+            try:
+                case.hit_archive_path = write_hit_archive(
+                    matcher.hits, archive_path, matcher.seq_len, matcher.query_len, matcher.ref_db,
+                    partial=matcher.partial
+                )
+            except OSError as exc:
+                app.logger.warning("Could not archive hits for case %s: %s", case.id, exc)
+
+        record_case_rollups(case, phage_match_objs)
         db.session.commit()
 
         # ➕ Additional Matches
@@ -170,11 +286,139 @@ def upload():
             report=case,
             bacteria_info=bacteria_info,
             phage_info_list=phage_info_list,
-            additional_outputs=additional_outputs
+            additional_outputs=additional_outputs,
+            partial=matcher.partial
         )
 
     return render_template("home.html")
 
 
+@app.route("/blast/queue")
+def blast_queue():
+    return jsonify(blast_scheduler.stats())
+
+
+@app.route("/cases")
+def case_history():
+    match_type = request.args.get("match_type")
+    if match_type not in (None, "exact", "partial"):
+        return jsonify({"error": "match_type must be 'exact' or 'partial'"}), 400
+    limit = min(max(request.args.get("limit", 50, type=int), 1), 200)
+    try:
+        cases, next_cursor = list_cases(
+            user_id=request.args.get("user_id", type=int),
+            organism=request.args.get("organism"),
+            match_type=match_type,
+            limit=limit,
+            cursor=request.args.get("cursor")
+        )
+    except InvalidCursor as exc:
+        return jsonify({"error": str(exc)}), 400
+    return jsonify({"cases": [serialize_case(case) for case in cases], "next_cursor": next_cursor})
+
+
+@app.route("/cases/summary/organisms")
+def case_organism_summary():
+    since = request.args.get("since")
+    try:
+        since = datetime.fromisoformat(since) if since else None
+    except ValueError:
+        return jsonify({"error": "since must be an ISO date"}), 400
+    return jsonify(organism_weekly_summary(since=since, organism=request.args.get("organism")))
+
+
+@app.route("/cases/summary/phages")
+def case_phage_summary():
+    limit = min(max(request.args.get("limit", 50, type=int), 1), 500)
+    return jsonify(phage_recommendation_summary(phage_name=request.args.get("phage"), limit=limit))
+
+
+@app.route("/jobs/<job_id>/cancel", methods=["POST"])
+def cancel_job(job_id):
+    if not JobRegistry.is_valid_job_id(job_id):
+        return jsonify({"error": "invalid job id"}), 400
+    if not job_registry.cancel(job_id):
+        return jsonify({"error": "no such job in flight"}), 404
+    return jsonify({"job_id": job_id, "status": "cancelling"}), 202
+
+
+@app.cli.command("rescore-cases")
+@click.option("--threshold", default=96.2, show_default=True, help="High-probability identity threshold.")
+@click.option("--exact-threshold", default=99.9, show_default=True, help="Identity threshold for exact matches.")
+@click.option("--match-len-threshold", default=0.9, show_default=True, help="Aligned fraction for exact matches.")
+@click.option("--workers", default=os.cpu_count() or 1, show_default=True, help="Parallel scoring processes.")
+@click.option("--include-partial", is_flag=True, help="Also re-score hit tables from searches cut short by a deadline.")
+@click.option("--apply", is_flag=True, help="Write the new scores back to the case reports.")
+def rescore_cases(threshold, exact_threshold, match_len_threshold, workers, include_partial, apply):
+    """Re-score archived BLAST hits of every case with the given thresholds."""
+    cases = {
+        case.hit_archive_path: case
+        for case in CaseReport.query.filter(CaseReport.hit_archive_path.isnot(None)).all()
+        if os.path.isdir(case.hit_archive_path)
+    }
+    matcher_kwargs = {
+        "high_prob_threshold": threshold,
+        "exact_match_threshold": exact_threshold,
+        "match_len_threshold": match_len_threshold,
+    }
+    changed = skipped = not_applied = 0
+    with ProcessPoolExecutor(max_workers=workers) as pool:
+        futures = [pool.submit(rescore_archive, path, matcher_kwargs, include_partial) for path in cases]
+        for future in futures:
+            path, partial, exact, matches = future.result()
+            case = cases[path]
+            if matches is None:
+                skipped += 1
+                continue
+            top_id, top_prob = matches[0] if matches else (None, None)
+            bacteria = Bacteria.query.filter_by(bacteria_id=top_id).first() if top_id else None
+            name = bacteria.name if bacteria else "Unknown"
+            if name != case.name or bool(exact) != bool(case.matches_100):
+                changed += 1
+                note = ", incomplete hits" if partial else ""
+                click.echo(f"Case {case.id}: {case.name} -> {name} ({'exact' if exact else 'partial'}, {top_prob}{note})")
+            if not apply:
+                continue
+            if name != case.name:
+                # A new organism means new phage recommendations; that needs a full re-run.
+                not_applied += 1
+                click.echo(f"Case {case.id}: organism change not applied, re-run the upload to update it")
+                continue
+            record_case_rollups(case, case.phage_matches, sign=-1)
+            case.match_score = top_prob
+            case.match_effectiveness = top_prob
+            case.matches_100 = 1 if exact else 0
+            case.matches_partial = 0 if exact else 1
+            for phage_match in case.phage_matches:
+                phage_match.effectiveness = top_prob
+                phage_match.match_type = '100%' if exact else 'Partial'
+                phage_match.recommended = bool(exact)
+            record_case_rollups(case, case.phage_matches)
+    if apply:
+        db.session.commit()
+    click.echo(f"Re-scored {len(cases) - skipped} cases, {changed} changed, {skipped} partial archives skipped.")
+    if not_applied:
+        click.echo(f"{not_applied} organism changes were reported but not applied.")
+
+
+@app.cli.command("rebuild-case-rollups")
+def rebuild_case_rollups_command():
+    """Recompute the case history summary tables from all case reports."""
+    rebuild_case_rollups()
+    click.echo("Case rollups rebuilt.")
+
+
+@app.cli.command("build-digest-index")
+@click.option("--ref-db", default="data/bacteria_blst/blst", show_default=True, help="Reference BLAST database.")
+@click.option("--fasta", default=None, help="FASTA used to build the database (defaults to reading it via blastdbcmd).")
+def build_digest_index_command(ref_db, fasta):
+    """Build the exact-match digest index for a reference BLAST database."""
+    known_ids = {bacteria_id for (bacteria_id,) in db.session.query(Bacteria.bacteria_id)}
+    index, skipped = build_digest_index(ref_db, fasta, known_ids=known_ids)
+    click.echo(f"Indexed {len(index.records)} reference sequences for {ref_db}.")
+    if skipped:
+        click.echo(f"Skipped {len(skipped)} sequences with no matching bacteria record; they will go through BLAST.")
+
+
 if __name__ == "__main__":
     app.run(host="0.0.0.0")
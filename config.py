@@ -1,6 +1,110 @@
+import os
+
 from flask import Flask
+from sqlalchemy import event, inspect
+from sqlalchemy.engine import Engine, make_url
 from models import db, User
+from models.routing import REPLICA_BIND
 from seed.seed_data import create_dummy_data
+from matcher.host_range import refresh_host_range_index
+
+DATABASE_DEFAULTS = {
+    'SQLALCHEMY_DATABASE_URI': ('DATABASE_URL', 'sqlite:///app.db', str),
+    'DATABASE_READ_URL': ('DATABASE_READ_URL', None, str),
+    'DATABASE_POOL_SIZE': ('DATABASE_POOL_SIZE', 5, int),
+    'DATABASE_MAX_OVERFLOW': ('DATABASE_MAX_OVERFLOW', 10, int),
+    'DATABASE_POOL_PRE_PING': ('DATABASE_POOL_PRE_PING', True, lambda v: str(v).lower() in ('1', 'true', 'yes')),
+    'DATABASE_POOL_RECYCLE': ('DATABASE_POOL_RECYCLE', 1800, int),
+    'DATABASE_STATEMENT_TIMEOUT_MS': ('DATABASE_STATEMENT_TIMEOUT_MS', 30000, int),
+}
+
+
+def engine_options(uri, pool_size, max_overflow, pre_ping, recycle, statement_timeout_ms):
+    """
+    SQLAlchemy engine options for ``uri``, translating the statement timeout
+    into the backend's own setting (a busy timeout for SQLite).
+    """
+    backend = make_url(uri).get_backend_name()
+    options = {"pool_pre_ping": pre_ping, "pool_recycle": recycle}
+    if backend == "sqlite":
+        options["connect_args"] = {"timeout": statement_timeout_ms / 1000}
+        return options
+
+    options.update(pool_size=pool_size, max_overflow=max_overflow)
+    if backend == "postgresql":
+        options["connect_args"] = {"options": f"-c statement_timeout={statement_timeout_ms}"}
+    elif backend in ("mysql", "mariadb"):
+        options["connect_args"] = {"init_command": f"SET SESSION max_execution_time={statement_timeout_ms}"}
+    return options
+
+
+def configure_database(app):
+    """
+    Fill in the database settings from ``app.config``, falling back to the
+    environment and then to the defaults in ``DATABASE_DEFAULTS``. When
+    ``DATABASE_READ_URL`` is set it becomes the ``replica`` bind used for
+    read-only catalog queries.
+    """
+    for key, (env_var, default, cast) in DATABASE_DEFAULTS.items():
+        if key not in app.config:
+            value = os.environ.get(env_var)
+            app.config[key] = cast(value) if value is not None else default
+
+    pool_settings = (
+        app.config['DATABASE_POOL_SIZE'],
+        app.config['DATABASE_MAX_OVERFLOW'],
+        app.config['DATABASE_POOL_PRE_PING'],
+        app.config['DATABASE_POOL_RECYCLE'],
+        app.config['DATABASE_STATEMENT_TIMEOUT_MS'],
+    )
+    app.config['SQLALCHEMY_ENGINE_OPTIONS'] = engine_options(app.config['SQLALCHEMY_DATABASE_URI'], *pool_settings)
+    read_uri = app.config['DATABASE_READ_URL']
+    if read_uri:
+        binds = dict(app.config.get('SQLALCHEMY_BINDS') or {})
+        binds[REPLICA_BIND] = {"url": read_uri, **engine_options(read_uri, *pool_settings)}
+        app.config['SQLALCHEMY_BINDS'] = binds
+
+
+def upgrade_schema():
+    """
+    Bring a database created by an older release up to the current models.
+    ``db.create_all()`` only creates missing tables, so this adds nullable
+    columns and indexes that were introduced later. Must be called inside an
+    application context, after ``db.create_all()``.
+    """
+    engine = db.engine
+    inspector = inspect(engine)
+    for table in db.metadata.sorted_tables:
+        if not inspector.has_table(table.name):
+            continue
+        existing = {column["name"] for column in inspector.get_columns(table.name)}
+        for column in table.columns:
+            if column.name in existing or not column.nullable:
+                continue
+            column_type = column.type.compile(dialect=engine.dialect)
+            with engine.begin() as connection:
+                connection.exec_driver_sql(f'ALTER TABLE {table.name} ADD COLUMN {column.name} {column_type}')
+        for index in table.indexes:
+            index.create(bind=engine, checkfirst=True)
+
+
+@event.listens_for(Engine, "connect")
+def _set_sqlite_pragmas(dbapi_connection, connection_record):
+    """
+    Use WAL for SQLite files so readers don't block on the writer.
+    """
+    module = type(dbapi_connection).__module__
+    if not module.startswith("sqlite3"):
+        return
+    cursor = dbapi_connection.cursor()
+    try:
+        cursor.execute("PRAGMA journal_mode=WAL")
+    except Exception:
+        # Read-only connections cannot change the journal mode.
+        pass
+    finally:
+        cursor.close()
+
 
 def seed_database(app):
     with app.app_context():
@@ -11,4 +115,5 @@ def seed_database(app):
             db.session.commit()
             print("✅ Seed data loaded!")
         else:
-            print("✅ Database already seeded, skipping seeding.")
\ No newline at end of file
+            print("✅ Database already seeded, skipping seeding.")
+        refresh_host_range_index()
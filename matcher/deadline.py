@@ -0,0 +1,132 @@
+import os
+import re
+import threading
+import time
+
+_JOB_ID_RE = re.compile(r"^[A-Za-z0-9_-]{1,64}$")
+
+
+class Deadline:
+    """
+    A wall-clock budget for one match run that can also be cancelled,
+    either directly or through an external ``cancel_check`` callable.
+    """
+
+    def __init__(self, timeout=None, cancel_check=None):
+        """
+        Args:
+            timeout (float): Seconds from now until the deadline, or None for no limit.
+            cancel_check (callable): Optional zero-argument callable returning True
+                once the run has been cancelled elsewhere.
+        """
+        self.expires_at = time.monotonic() + timeout if timeout is not None else None
+        self._cancel_check = cancel_check
+        self._cancelled = threading.Event()
+
+    def remaining(self):
+        """
+        Seconds left before the deadline, or None if there is no limit.
+        """
+        if self.expires_at is None:
+            return None
+        return max(0.0, self.expires_at - time.monotonic())
+
+    def expired(self):
+        return self.expires_at is not None and time.monotonic() >= self.expires_at
+
+    def cancel(self):
+        self._cancelled.set()
+
+    def cancelled(self):
+        if not self._cancelled.is_set() and self._cancel_check is not None and self._cancel_check():
+            self._cancelled.set()
+        return self._cancelled.is_set()
+
+
+class JobRegistry:
+    """
+    In-flight match jobs and their cancellation markers, kept as files in a
+    shared directory so a cancel request handled by one worker reaches the
+    worker running the job. Only jobs registered with ``start`` can be
+    cancelled, and markers older than ``max_age`` seconds are treated as
+    left behind by a dead worker and removed.
+    """
+
+    def __init__(self, state_dir, max_age=3600):
+        self.state_dir = state_dir
+        self.max_age = max_age
+        os.makedirs(state_dir, exist_ok=True)
+
+    @staticmethod
+    def is_valid_job_id(job_id):
+        return bool(job_id) and bool(_JOB_ID_RE.match(job_id))
+
+    def _marker(self, job_id, kind):
+        if not self.is_valid_job_id(job_id):
+            raise ValueError(f"Invalid job id: {job_id!r}")
+        return os.path.join(self.state_dir, f"{job_id}.{kind}")
+
+    def _is_fresh(self, path):
+        try:
+            return time.time() - os.path.getmtime(path) < self.max_age
+        except OSError:
+            return False
+
+    @staticmethod
+    def _remove(path):
+        try:
+            os.remove(path)
+        except FileNotFoundError:
+            pass
+
+    def prune(self):
+        """
+        Remove markers older than ``max_age``.
+        """
+        for name in os.listdir(self.state_dir):
+            path = os.path.join(self.state_dir, name)
+            if not self._is_fresh(path):
+                self._remove(path)
+
+    def start(self, job_id):
+        """
+        Register ``job_id`` as in flight.
+
+        Returns:
+            bool: False if a live job already uses this id.
+        """
+        self.prune()
+        running = self._marker(job_id, "running")
+        try:
+            fd = os.open(running, os.O_CREAT | os.O_EXCL | os.O_WRONLY)
+        except FileExistsError:
+            return False
+        os.close(fd)
+        self._remove(self._marker(job_id, "cancel"))
+        return True
+
+    def cancel(self, job_id):
+        """
+        Request cancellation of an in-flight job.
+
+        Returns:
+            bool: False if no such job is running.
+        """
+        if not self._is_fresh(self._marker(job_id, "running")):
+            return False
+        with open(self._marker(job_id, "cancel"), "w"):
+            pass
+        return True
+
+    def is_cancelled(self, job_id):
+        return os.path.exists(self._marker(job_id, "cancel"))
+
+    def clear(self, job_id):
+        self._remove(self._marker(job_id, "cancel"))
+        self._remove(self._marker(job_id, "running"))
+
+    def deadline_for(self, job_id, timeout=None):
+        """
+        Create a Deadline that is cancelled once ``cancel(job_id)`` is called.
+        """
+        return Deadline(timeout, cancel_check=lambda: self.is_cancelled(job_id))
@@ -0,0 +1,210 @@
+import hashlib
+import json
+import os
+import subprocess
+import threading
+
+from Bio import SeqIO
+
+CHUNK_SIZE = 1 << 16
+FORMAT_VERSION = 1
+
+# IUPAC nucleotide complements, so ambiguity codes survive canonicalization.
+_COMPLEMENT = str.maketrans("ACGTRYKMBVDHSWN", "TGCAYRMKVBHDSWN")
+
+
+def canonicalize(seq):
+    """
+    Canonical form of a nucleotide sequence: upper case, U -> T, and the
+    lexicographically smaller of the sequence and its reverse complement,
+    so both strands of a record hash identically.
+    """
+    forward = str(seq).upper().replace("U", "T")
+    reverse = forward.translate(_COMPLEMENT)[::-1]
+    return min(forward, reverse)
+
+
+def _chunk_fingerprint(chunk):
+    return hashlib.blake2b(chunk.encode("ascii", "replace"), digest_size=8).hexdigest()
+
+
+def fingerprint(seq, chunk_size=CHUNK_SIZE):
+    """
+    Fingerprint a canonical sequence.
+
+    Returns:
+        tuple: (whole-record digest, [chunk fingerprint, ...])
+    """
+    whole = hashlib.blake2b(digest_size=16)
+    chunks = []
+    for start in range(0, len(seq), chunk_size):
+        chunk = seq[start:start + chunk_size]
+        whole.update(chunk.encode("ascii", "replace"))
+        chunks.append(_chunk_fingerprint(chunk))
+    return whole.hexdigest(), chunks
+
+
+class DigestIndex:
+    """
+    Whole-record digests and fixed-size chunk fingerprints of the reference
+    sequences, used to recognise exact resubmissions without running BLAST.
+
+    A query record is compared chunk by chunk against the reference records of
+    the same length, stopping at the first mismatching chunk, and only reported
+    once its whole-record digest matches too.
+    """
+
+    def __init__(self, records, chunk_size=CHUNK_SIZE):
+        """
+        Args:
+            records (list[dict]): [{"id", "length", "digest", "chunks"}, ...]
+            chunk_size (int): Chunk size the fingerprints were built with.
+        """
+        self.records = records
+        self.chunk_size = chunk_size
+        self._by_length = {}
+        for record in records:
+            self._by_length.setdefault(record["length"], []).append(record)
+
+    @classmethod
+    def build(cls, sequences, chunk_size=CHUNK_SIZE):
+        """
+        Build an index from ``(subject_id, sequence)`` pairs.
+
+        Returns:
+            DigestIndex
+        """
+        records = []
+        for subject_id, seq in sequences:
+            canonical = canonicalize(seq)
+            digest, chunks = fingerprint(canonical, chunk_size)
+            records.append({"id": subject_id, "length": len(canonical), "digest": digest, "chunks": chunks})
+        return cls(records, chunk_size)
+
+    @classmethod
+    def load(cls, path):
+        with open(path) as f:
+            data = json.load(f)
+        return cls(data["records"], data["chunk_size"])
+
+    def save(self, path):
+        tmp_path = f"{path}.tmp"
+        with open(tmp_path, "w") as f:
+            json.dump({"version": FORMAT_VERSION, "chunk_size": self.chunk_size, "records": self.records}, f)
+        os.replace(tmp_path, path)
+
+    def lookup_sequence(self, seq):
+        """
+        Return the ids of reference records identical to ``seq`` (either strand).
+
+        Returns:
+            list[str]
+        """
+        canonical = canonicalize(seq)
+        candidates = self._by_length.get(len(canonical), [])
+        whole = hashlib.blake2b(digest_size=16)
+        for i, start in enumerate(range(0, len(canonical), self.chunk_size)):
+            if not candidates:
+                return []
+            chunk = canonical[start:start + self.chunk_size]
+            chunk_fp = _chunk_fingerprint(chunk)
+            candidates = [record for record in candidates if record["chunks"][i] == chunk_fp]
+            whole.update(chunk.encode("ascii", "replace"))
+        digest = whole.hexdigest()
+        return [record["id"] for record in candidates if record["digest"] == digest]
+
+    def lookup(self, query_file):
+        """
+        Return the reference ids matched by a query FASTA file if every record
+        in it is an exact copy of a reference record, otherwise None.
+
+        Returns:
+            list[str] or None
+        """
+        subject_ids = []
+        for record in SeqIO.parse(query_file, "fasta"):
+            matched = self.lookup_sequence(record.seq)
+            if not matched:
+                return None
+            subject_ids.extend(s for s in matched if s not in subject_ids)
+        return subject_ids or None
+
+
+def get_digest_index_path(ref_db):
+    return f"{ref_db}.digest.json"
+
+
+def read_blastdb_sequences(ref_db):
+    """
+    Yield ``(subject_id, sequence)`` for every record in a BLAST database.
+
+    The id is the first word of the record title, which is what blastn reports
+    as ``sseqid`` for databases built without ``-parse_seqids``; the accession
+    (``%a``) would be the internal ordinal id instead.
+    """
+    result = subprocess.run(
+        ["blastdbcmd", "-db", ref_db, "-entry", "all", "-outfmt", "%t\t%s"],
+        stdout=subprocess.PIPE, stderr=subprocess.PIPE, text=True, check=True
+    )
+    for line in result.stdout.splitlines():
+        if not line.strip():
+            continue
+        title, seq = line.split("\t", 1)
+        words = title.split()
+        if words:
+            yield words[0], seq
+
+
+def read_fasta_sequences(fasta_file):
+    for record in SeqIO.parse(fasta_file, "fasta"):
+        yield record.id, str(record.seq)
+
+
+def build_digest_index(ref_db, fasta_file=None, known_ids=None):
+    """
+    Build and save the digest index next to ``ref_db``. Run this whenever the
+    BLAST database is (re)built, from the same FASTA passed to makeblastdb or
+    from the database itself via blastdbcmd.
+
+    Args:
+        ref_db (str): Path to the reference BLAST database.
+        fasta_file (str): Optional FASTA the database was built from.
+        known_ids (set[str]): If given, only records with these ids are indexed,
+            so queries matching any other record fall back to BLAST.
+
+    Returns:
+        tuple:
+            - DigestIndex
+            - list[str]: Ids that were left out because they are not in ``known_ids``
+    """
+    sequences = read_fasta_sequences(fasta_file) if fasta_file else read_blastdb_sequences(ref_db)
+    skipped = []
+    if known_ids is not None:
+        sequences = list(sequences)
+        skipped = [subject_id for subject_id, _ in sequences if subject_id not in known_ids]
+        sequences = [(subject_id, seq) for subject_id, seq in sequences if subject_id in known_ids]
+    index = DigestIndex.build(sequences)
+    index.save(get_digest_index_path(ref_db))
+    return index, skipped
+
+
+_cache = {}
+_cache_lock = threading.Lock()
+
+
+def load_digest_index(ref_db):
+    """
+    Return the digest index for ``ref_db``, or None if it has not been built.
+    The loaded index is cached per process and reloaded when the file changes.
+    """
+    path = get_digest_index_path(ref_db)
+    try:
+        mtime = os.path.getmtime(path)
+    except OSError:
+        return None
+    with _cache_lock:
+        cached = _cache.get(path)
+        if cached is None or cached[0] != mtime:
+            cached = (mtime, DigestIndex.load(path))
+            _cache[path] = cached
+        return cached[1]
@@ -0,0 +1,10 @@
+class BlastError(Exception):
+    """Raised when blastn cannot be run or exits with an error."""
+
+
+class BlastTimeout(BlastError):
+    """Raised when a BLAST search exceeds its deadline."""
+
+
+class BlastCancelled(BlastError):
+    """Raised when a BLAST search is cancelled by the client."""
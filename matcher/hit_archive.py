@@ -0,0 +1,130 @@
+import json
+import os
+from datetime import datetime
+
+import numpy as np
+import pandas as pd
+
+from matcher.matcher import Matcher, BLAST_COLUMNS
+
+# On-disk dtype of every numeric BLAST column.
+NUMERIC_DTYPES = {
+    # float64 so re-scoring sees exactly the values the live run compared
+    # against the identity thresholds.
+    '%_identity': np.float64,
+    'alignment_len': np.int32,
+    'mismatches': np.int32,
+    'gap_opens': np.int32,
+    'query_start': np.int32,
+    'query_end': np.int32,
+    'subject_start': np.int32,
+    'subject_end': np.int32,
+    'e_value': np.float64,
+    'bit_score': np.float64,
+}
+# String columns, stored as int32 codes plus a dictionary of distinct values.
+DICTIONARY_COLUMNS = ('query_id', 'subject_id')
+
+META_FILE = "meta.json"
+# Version 1 stored identity and bit score as float32.
+FORMAT_VERSION = 2
+
+
+def _column_file(path, column):
+    # '%_identity' is not a friendly file name.
+    return os.path.join(path, column.replace('%_', 'pct_') + ".npy")
+
+
+def write_hit_archive(blast_df, path, seq_len, query_len, ref_db, partial=False):
+    """
+    Store a BLAST hit table as one typed ``.npy`` file per column, with the
+    query and subject id columns dictionary-encoded.
+
+    Args:
+        blast_df (pd.DataFrame): BLAST results.
+        path (str): Archive directory to create.
+        seq_len (int): Length of the first query record.
+        query_len (int): Total length of all query records.
+        ref_db (str): Reference database the hits were produced against.
+        partial (bool): True if the search was cut short and the table is incomplete.
+
+    Returns:
+        str: The archive directory.
+    """
+    os.makedirs(path, exist_ok=True)
+    for column in DICTIONARY_COLUMNS:
+        codes, values = pd.factorize(blast_df[column].astype(str))
+        np.save(_column_file(path, column), codes.astype(np.int32))
+        np.save(_column_file(path, column + "_dict"), np.asarray(values, dtype=str))
+    for column, dtype in NUMERIC_DTYPES.items():
+        np.save(_column_file(path, column), blast_df[column].to_numpy(dtype=dtype))
+
+    meta = {
+        "version": FORMAT_VERSION,
+        "rows": len(blast_df),
+        "seq_len": int(seq_len),
+        "query_len": int(query_len),
+        "ref_db": ref_db,
+        "partial": bool(partial),
+        "created_at": datetime.utcnow().isoformat(),
+    }
+    with open(os.path.join(path, META_FILE), "w") as f:
+        json.dump(meta, f)
+    return path
+
+
+def read_hit_archive(path):
+    """
+    Load an archived hit table. Numeric columns and id codes are memory-mapped;
+    id columns come back as categoricals over the stored dictionaries.
+
+    Args:
+        path (str): Archive directory.
+
+    Returns:
+        tuple:
+            - pd.DataFrame: BLAST results with the original column names
+            - dict: Archive metadata
+    """
+    with open(os.path.join(path, META_FILE)) as f:
+        meta = json.load(f)
+
+    def load(column):
+        # Zero-length arrays cannot be memory-mapped.
+        return np.load(_column_file(path, column), mmap_mode='r' if meta["rows"] else None)
+
+    columns = {}
+    for column in BLAST_COLUMNS:
+        if column in DICTIONARY_COLUMNS:
+            categories = np.load(_column_file(path, column + "_dict"))
+            columns[column] = pd.Categorical.from_codes(load(column), categories=categories)
+        elif meta["version"] < 2 and column in ('%_identity', 'bit_score'):
+            # blastn prints these with at most three decimals, so rounding the
+            # widened float32 values recovers what the live run saw.
+            columns[column] = np.round(load(column).astype(np.float64), 3)
+        else:
+            columns[column] = load(column)
+    return pd.DataFrame(columns, copy=False), meta
+
+
+def rescore_archive(path, matcher_kwargs, include_partial=False):
+    """
+    Re-run Matcher scoring on an archived hit table. Intended as a
+    process-pool task, so it only takes and returns plain values.
+
+    Args:
+        path (str): Archive directory.
+        matcher_kwargs (dict): Threshold arguments for ``Matcher``.
+        include_partial (bool): Also score tables from searches that were cut short.
+
+    Returns:
+        tuple: (path, partial, exact, [(subject_id, identity), ...]); ``exact`` and
+            the matches are None when a partial archive is skipped.
+    """
+    blast_df, meta = read_hit_archive(path)
+    partial = meta.get("partial", False)
+    if partial and not include_partial:
+        return path, True, None, None
+    matcher = Matcher(ref_db=meta["ref_db"], **matcher_kwargs)
+    exact, matches = matcher.score(blast_df, meta["seq_len"], meta["query_len"])
+    return path, partial, exact, [(str(subject_id), float(prob)) for subject_id, prob in matches]
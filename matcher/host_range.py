@@ -0,0 +1,317 @@
+import os
+import threading
+import time
+
+import numpy as np
+from flask import current_app
+
+from models import BacteriaInteraction, PhageInteraction
+
+# Strength labels, ordered so that a larger code means a stronger interaction.
+STRENGTHS = ("none", "weak", "strong")
+STRENGTH_CODES = {label: code for code, label in enumerate(STRENGTHS)}
+
+_INTERACTION_COLUMNS = {
+    "none": "no_infection",
+    "weak": "weak_infection",
+    "strong": "strong_infection",
+}
+
+
+class HostRangeIndex:
+    """
+    An in-memory bipartite graph of phage/bacteria interactions stored as
+    CSR adjacency arrays in both directions.
+
+    Nodes are mapped to dense integer indices. For each direction,
+    ``indptr[i]:indptr[i + 1]`` slices ``indices`` (sorted neighbour indices)
+    and ``strengths`` (int8 codes from ``STRENGTHS``) for node ``i``.
+    """
+
+    def __init__(self, bacteria_ids, phage_ids, edges):
+        """
+        Build the index from node ids and an edge list.
+
+        Args:
+            bacteria_ids (list[str]): Bacteria UUIDs, one per node.
+            phage_ids (list[str]): Phage UUIDs, one per node.
+            edges (tuple[np.ndarray, np.ndarray, np.ndarray]): Parallel arrays of
+                bacteria indices, phage indices and strength codes. Duplicate
+                pairs are collapsed, keeping the strongest label.
+        """
+        self.bacteria_ids = np.asarray(bacteria_ids, dtype=object)
+        self.phage_ids = np.asarray(phage_ids, dtype=object)
+        self._bacteria_pos = {b: i for i, b in enumerate(bacteria_ids)}
+        self._phage_pos = {p: i for i, p in enumerate(phage_ids)}
+
+        b_idx, p_idx, strength = (np.asarray(a) for a in edges)
+        b_idx, p_idx, strength = self._dedupe(
+            b_idx.astype(np.int32), p_idx.astype(np.int32), strength.astype(np.int8)
+        )
+
+        self.phage_indptr, self.phage_hosts, self.phage_strengths = self._to_csr(
+            p_idx, b_idx, strength, len(phage_ids)
+        )
+        self.bacteria_indptr, self.bacteria_phages, self.bacteria_strengths = self._to_csr(
+            b_idx, p_idx, strength, len(bacteria_ids)
+        )
+
+    @staticmethod
+    def _dedupe(b_idx, p_idx, strength):
+        """
+        Collapse duplicate (bacteria, phage) pairs, keeping the strongest label.
+        """
+        if len(b_idx) == 0:
+            return b_idx, p_idx, strength
+        # Sort by pair, strongest first, then keep the first row of every pair.
+        order = np.lexsort((-strength.astype(np.int16), p_idx, b_idx))
+        b_idx, p_idx, strength = b_idx[order], p_idx[order], strength[order]
+        first = np.ones(len(b_idx), dtype=bool)
+        first[1:] = (b_idx[1:] != b_idx[:-1]) | (p_idx[1:] != p_idx[:-1])
+        return b_idx[first], p_idx[first], strength[first]
+
+    @staticmethod
+    def _to_csr(rows, cols, strength, n_rows):
+        """
+        Build CSR arrays with neighbour indices sorted within every row.
+        """
+        order = np.lexsort((cols, rows))
+        indptr = np.zeros(n_rows + 1, dtype=np.int64)
+        np.cumsum(np.bincount(rows, minlength=n_rows), out=indptr[1:])
+        return indptr, cols[order], strength[order]
+
+    @staticmethod
+    def _strength_mask(strengths, min_strength):
+        return strengths >= STRENGTH_CODES[min_strength]
+
+    @staticmethod
+    def _gather(indptr, indices, strengths, rows, min_strength):
+        """
+        Return the union of neighbours of ``rows`` at or above ``min_strength``.
+        """
+        if len(rows) == 0:
+            return np.empty(0, dtype=indices.dtype)
+        starts = indptr[rows]
+        lengths = indptr[rows + 1] - starts
+        total = int(lengths.sum())
+        if total == 0:
+            return np.empty(0, dtype=indices.dtype)
+        # Expand every [start, end) slice into flat positions without a Python loop.
+        offsets = np.repeat(starts - np.cumsum(lengths) + lengths, lengths)
+        positions = offsets + np.arange(total)
+        keep = strengths[positions] >= STRENGTH_CODES[min_strength]
+        return np.unique(indices[positions[keep]])
+
+    @classmethod
+    def from_db(cls):
+        """
+        Load the index from the ``bacteria_interactions`` and
+        ``phage_interactions`` tables.
+
+        Returns:
+            HostRangeIndex
+        """
+        pairs = []
+        for row in BacteriaInteraction.query.all():
+            for label, column in _INTERACTION_COLUMNS.items():
+                for phage_id in _split_ids(getattr(row, column)):
+                    pairs.append((row.bacteria_id, phage_id, STRENGTH_CODES[label]))
+        for row in PhageInteraction.query.all():
+            for label, column in _INTERACTION_COLUMNS.items():
+                for bacteria_id in _split_ids(getattr(row, column)):
+                    pairs.append((bacteria_id, row.phage_id, STRENGTH_CODES[label]))
+        return cls.from_pairs(pairs)
+
+    @classmethod
+    def from_pairs(cls, pairs):
+        """
+        Build the index from ``(bacteria_id, phage_id, strength_code)`` tuples.
+
+        Returns:
+            HostRangeIndex
+        """
+        bacteria_ids = sorted({b for b, _, _ in pairs})
+        phage_ids = sorted({p for _, p, _ in pairs})
+        b_pos = {b: i for i, b in enumerate(bacteria_ids)}
+        p_pos = {p: i for i, p in enumerate(phage_ids)}
+        edges = (
+            np.fromiter((b_pos[b] for b, _, _ in pairs), dtype=np.int32, count=len(pairs)),
+            np.fromiter((p_pos[p] for _, p, _ in pairs), dtype=np.int32, count=len(pairs)),
+            np.fromiter((s for _, _, s in pairs), dtype=np.int8, count=len(pairs)),
+        )
+        return cls(bacteria_ids, phage_ids, edges)
+
+    def hosts_of_phage(self, phage_id, min_strength="strong"):
+        """
+        Return all bacteria the phage infects at or above ``min_strength``.
+
+        Args:
+            phage_id (str): Phage UUID.
+            min_strength (str): One of ``STRENGTHS``.
+
+        Returns:
+            list[tuple[str, str]]: [(bacteria_id, strength), ...]
+        """
+        pos = self._phage_pos.get(phage_id)
+        if pos is None:
+            return []
+        lo, hi = self.phage_indptr[pos], self.phage_indptr[pos + 1]
+        hosts = self.phage_hosts[lo:hi]
+        strengths = self.phage_strengths[lo:hi]
+        keep = self._strength_mask(strengths, min_strength)
+        return [
+            (self.bacteria_ids[b], STRENGTHS[s])
+            for b, s in zip(hosts[keep], strengths[keep])
+        ]
+
+    def phages_of_bacteria(self, bacteria_id, min_strength="strong"):
+        """
+        Return all phages that infect the bacteria at or above ``min_strength``.
+
+        Returns:
+            list[tuple[str, str]]: [(phage_id, strength), ...]
+        """
+        pos = self._bacteria_pos.get(bacteria_id)
+        if pos is None:
+            return []
+        lo, hi = self.bacteria_indptr[pos], self.bacteria_indptr[pos + 1]
+        phages = self.bacteria_phages[lo:hi]
+        strengths = self.bacteria_strengths[lo:hi]
+        keep = self._strength_mask(strengths, min_strength)
+        return [
+            (self.phage_ids[p], STRENGTHS[s])
+            for p, s in zip(phages[keep], strengths[keep])
+        ]
+
+    def shared_phages(self, bacteria_a, bacteria_b, min_strength="strong"):
+        """
+        Return phage UUIDs that infect both bacteria at or above ``min_strength``.
+
+        Returns:
+            list[str]
+        """
+        a = self._bacteria_pos.get(bacteria_a)
+        b = self._bacteria_pos.get(bacteria_b)
+        if a is None or b is None:
+            return []
+        rows = []
+        for pos in (a, b):
+            lo, hi = self.bacteria_indptr[pos], self.bacteria_indptr[pos + 1]
+            keep = self._strength_mask(self.bacteria_strengths[lo:hi], min_strength)
+            rows.append(self.bacteria_phages[lo:hi][keep])
+        shared = np.intersect1d(rows[0], rows[1], assume_unique=True)
+        return list(self.phage_ids[shared])
+
+    def neighborhood(self, node_id, k=2, min_strength="strong"):
+        """
+        Return all nodes reachable within ``k`` hops of a phage or bacteria,
+        alternating between the two sides of the graph.
+
+        Args:
+            node_id (str): Phage or bacteria UUID.
+            k (int): Maximum number of hops.
+            min_strength (str): Only traverse edges at or above this strength.
+
+        Returns:
+            dict: {"bacteria": [bacteria_id, ...], "phages": [phage_id, ...]}
+                excluding ``node_id`` itself.
+        """
+        seen_b = np.zeros(len(self.bacteria_ids), dtype=bool)
+        seen_p = np.zeros(len(self.phage_ids), dtype=bool)
+        frontier_b = np.empty(0, dtype=np.int64)
+        frontier_p = np.empty(0, dtype=np.int64)
+
+        if node_id in self._bacteria_pos:
+            frontier_b = np.array([self._bacteria_pos[node_id]])
+            seen_b[frontier_b] = True
+        elif node_id in self._phage_pos:
+            frontier_p = np.array([self._phage_pos[node_id]])
+            seen_p[frontier_p] = True
+        else:
+            return {"bacteria": [], "phages": []}
+
+        for _ in range(k):
+            next_p = self._gather(
+                self.bacteria_indptr, self.bacteria_phages, self.bacteria_strengths,
+                frontier_b, min_strength
+            )
+            next_b = self._gather(
+                self.phage_indptr, self.phage_hosts, self.phage_strengths,
+                frontier_p, min_strength
+            )
+            frontier_p = next_p[~seen_p[next_p]]
+            frontier_b = next_b[~seen_b[next_b]]
+            if len(frontier_p) == 0 and len(frontier_b) == 0:
+                break
+            seen_p[frontier_p] = True
+            seen_b[frontier_b] = True
+
+        if node_id in self._bacteria_pos:
+            seen_b[self._bacteria_pos[node_id]] = False
+        else:
+            seen_p[self._phage_pos[node_id]] = False
+        return {
+            "bacteria": list(self.bacteria_ids[seen_b]),
+            "phages": list(self.phage_ids[seen_p]),
+        }
+
+
+def _split_ids(raw):
+    if not raw:
+        return []
+    return [part.strip() for part in raw.split(',') if part.strip()]
+
+
+STAMP_FILE = "host_range.stamp"
+
+_index = None
+_index_stamp = None
+_index_lock = threading.Lock()
+
+
+def _stamp_path():
+    return os.path.join(current_app.instance_path, STAMP_FILE)
+
+
+def _read_stamp():
+    try:
+        return os.stat(_stamp_path()).st_mtime_ns
+    except OSError:
+        return None
+
+
+def get_host_range_index():
+    """
+    Return the process-wide host-range index, loading it on first use and
+    reloading it once another process has refreshed it (see the stamp file
+    written by ``refresh_host_range_index``). Must be called inside an
+    application context.
+    """
+    global _index, _index_stamp
+    stamp = _read_stamp()
+    if _index is None or stamp != _index_stamp:
+        with _index_lock:
+            if _index is None or stamp != _index_stamp:
+                _index = HostRangeIndex.from_db()
+                _index_stamp = stamp
+    return _index
+
+
+def refresh_host_range_index():
+    """
+    Rebuild the host-range index from the interaction tables, swap it in and
+    bump the shared stamp file so every other worker reloads on next access.
+    Must be called inside an application context.
+    """
+    global _index, _index_stamp
+    index = HostRangeIndex.from_db()
+    path = _stamp_path()
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    with open(path, "w") as f:
+        f.write(str(time.time_ns()))
+    now = time.time_ns()
+    os.utime(path, ns=(now, now))
+    with _index_lock:
+        _index = index
+        _index_stamp = _read_stamp()
+    return index
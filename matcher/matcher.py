@@ -1,16 +1,30 @@
+import numpy as np
 import pandas as pd 
 from Bio import SeqIO
+import os
+import signal
 import subprocess
+import threading
 from io import StringIO
 import pdb 
 
+from matcher.errors import BlastError, BlastTimeout, BlastCancelled
+from matcher.scheduler import SchedulerBusy
+
+BLAST_COLUMNS = [
+    'query_id', 'subject_id', '%_identity', 'alignment_len', 'mismatches', 'gap_opens', 
+    'query_start', 'query_end', 'subject_start', 'subject_end', 'e_value', 'bit_score'
+]
+
+
 class Matcher:
     """
     A BLAST-based sequence matcher for identifying exact or high-probability matches 
     to a reference database using nucleotide identity and alignment length criteria.
     """
     
-    def __init__(self, ref_db, exact_match_threshold=99.9, match_len_threshold=0.9, high_prob_threshold=94):
+    def __init__(self, ref_db, exact_match_threshold=99.9, match_len_threshold=0.9, high_prob_threshold=94,
+                 scheduler=None, allow_partial=False, poll_interval=0.2, digest_index=None):
         """
         Initialize the Matcher with configurable thresholds and a reference BLAST database.
 
@@ -19,11 +33,24 @@ class Matcher:
             match_len_threshold (float): Minimum fraction of query length that must align.
             high_prob_threshold (float): Threshold for high-probability matches (avg identity).
             ref_db (str): Path to the reference BLAST database.
+            scheduler (BlastScheduler): Optional admission control for blastn processes.
+            allow_partial (bool): Return hits streamed before a deadline instead of raising.
+            poll_interval (float): Seconds between deadline checks while blastn runs.
+            digest_index (DigestIndex): Optional index of reference sequence digests used
+                to answer exact resubmissions without running BLAST.
         """
         self.ref_db = ref_db  
         self.exact_match_threshold = exact_match_threshold
         self.match_len_threshold = match_len_threshold
         self.high_prob_threshold = high_prob_threshold 
+        self.scheduler = scheduler
+        self.allow_partial = allow_partial
+        self.poll_interval = poll_interval
+        self.digest_index = digest_index
+        self.partial = False
+        self.hits = None
+        self.seq_len = None
+        self.query_len = None
 
     @staticmethod
     def get_longest_hits(blast_df):
@@ -51,6 +78,19 @@ class Matcher:
             int: Length of the sequence.
         """
         return len(next(SeqIO.parse(seq_file, "fasta")).seq)
+
+    @staticmethod
+    def get_total_sequence_len(seq_file):
+        """
+        Sum the lengths of all records in a FASTA file (e.g. every contig of an assembly).
+
+        Args:
+            seq_file (str): Path to the query FASTA file.
+
+        Returns:
+            int: Total sequence length.
+        """
+        return sum(len(record.seq) for record in SeqIO.parse(seq_file, "fasta"))
     
     @staticmethod
     def aggregate_identities(blast_df):
@@ -77,30 +117,193 @@ class Matcher:
         )
 
         return aggregated_identity
-    
-    def blast(self, query_file):
+
+    @staticmethod
+    def score_coverage(blast_df, query_len):
+        """
+        Score subjects by merged query coverage instead of summed alignment length.
+
+        HSP query intervals are merged per (query, subject) with a single sort
+        and a running maximum, so overlapping HSPs are only counted once. Each
+        HSP's identity is weighted by the query bases it newly covers.
+
+        Args:
+            blast_df (pd.DataFrame): BLAST output dataframe.
+            query_len (int): Total length of the query sequence(s).
+
+        Returns:
+            pd.DataFrame: One row per subject with ``covered_bases``,
+                ``query_coverage`` (0-1), ``avg_identity`` (over covered bases) and
+                ``coverage_weighted_identity``, sorted by the latter.
+        """
+        columns = ["subject_id", "covered_bases", "query_coverage",
+                   "avg_identity", "coverage_weighted_identity"]
+        if blast_df.empty:
+            return pd.DataFrame(columns=columns)
+
+        subject_codes, subjects = pd.factorize(blast_df["subject_id"])
+        query_codes, _ = pd.factorize(blast_df["query_id"])
+        q_start = blast_df["query_start"].to_numpy(dtype=np.int64)
+        q_end = blast_df["query_end"].to_numpy(dtype=np.int64)
+        # Half-open [start, end) intervals, independent of HSP orientation.
+        start = np.minimum(q_start, q_end) - 1
+        end = np.maximum(q_start, q_end)
+        identity = blast_df["%_identity"].to_numpy(dtype=np.float64)
+
+        # Shift every (query, subject) group into its own coordinate band so a
+        # single global sort and running max never cross group boundaries.
+        span = int(end.max()) + 1
+        group = subject_codes.astype(np.int64) * (int(query_codes.max()) + 1) + query_codes
+        band = group * span
+        order = np.argsort(band + start, kind="stable")
+        start, end, band = start[order] + band[order], end[order] + band[order], band[order]
+
+        reach = np.maximum.accumulate(end)
+        prev_reach = np.empty_like(reach)
+        prev_reach[0] = band[0]
+        prev_reach[1:] = np.maximum(reach[:-1], band[1:])
+        new_bases = np.clip(end - np.maximum(start, prev_reach), 0, None)
+
+        codes = subject_codes[order]
+        n_subjects = len(subjects)
+        covered = np.bincount(codes, weights=new_bases, minlength=n_subjects)
+        identity_sum = np.bincount(codes, weights=identity[order] * new_bases, minlength=n_subjects)
+
+        coverage = np.minimum(covered / max(query_len, 1), 1.0)
+        avg_identity = np.divide(identity_sum, covered, out=np.zeros(n_subjects), where=covered > 0)
+        scored = pd.DataFrame({
+            "subject_id": np.asarray(subjects),
+            "covered_bases": covered.astype(np.int64),
+            "query_coverage": coverage,
+            "avg_identity": avg_identity,
+            "coverage_weighted_identity": avg_identity * coverage,
+        })
+        return scored.sort_values("coverage_weighted_identity", ascending=False, ignore_index=True)
+
+    def blast(self, query_file, deadline=None):
         """
         Run BLASTN for the given query file against the reference database.
+        If a scheduler is configured, the search first waits for a slot.
 
         Args:
             query_file (str): Path to the query FASTA file.
+            deadline (Deadline): Optional deadline/cancellation for the search.
+
+        Returns:
+            pd.DataFrame: Parsed BLAST tabular output. ``self.partial`` is True if
+                the search was cut short and only the hits streamed so far are returned.
+
+        Raises:
+            SchedulerBusy: If the scheduler rejects the search.
+            BlastTimeout: If the deadline passes and partial results are not allowed.
+            BlastCancelled: If the run is cancelled.
+            BlastError: If blastn cannot be started or exits with an error.
+        """
+        self.partial = False
+        if self.scheduler is None:
+            return self._run_blast(query_file, deadline=deadline)
+        timeout = deadline.remaining() if deadline is not None else None
+        try:
+            with self.scheduler.acquire(query_file, self.ref_db, timeout=timeout, deadline=deadline) as lease:
+                return self._run_blast(query_file, lease, deadline)
+        except SchedulerBusy as exc:
+            if deadline is not None and deadline.expired():
+                raise BlastTimeout("Deadline passed while waiting for a BLAST slot") from exc
+            raise
+
+    @staticmethod
+    def parse_blast_output(lines):
+        """
+        Parse BLAST ``-outfmt 6`` lines, dropping a truncated trailing line.
+
+        Args:
+            lines (list[str]): Tabular output lines.
 
         Returns:
             pd.DataFrame: Parsed BLAST tabular output.
         """
+        complete = [line for line in lines if line.endswith("\n") and line.count("\t") == len(BLAST_COLUMNS) - 1]
+        if not complete:
+            return pd.DataFrame(columns=BLAST_COLUMNS)
+        blast_output = StringIO("".join(complete))
+        return pd.read_csv(blast_output, header=None, names=BLAST_COLUMNS, sep='\t')
+
+    @staticmethod
+    def _kill_process_group(proc, grace=2.0):
+        for sig in (signal.SIGTERM, signal.SIGKILL):
+            try:
+                os.killpg(proc.pid, sig)
+            except ProcessLookupError:
+                return
+            try:
+                proc.wait(timeout=grace)
+                return
+            except subprocess.TimeoutExpired:
+                continue
+
+    def _run_blast(self, query_file, lease=None, deadline=None):
         blast_command = [
             "blastn",
             "-query", query_file,
             "-db", self.ref_db,
             "-outfmt", "6"
         ]
-        result = subprocess.run(blast_command, stdout=subprocess.PIPE, stderr=subprocess.PIPE, text=True)
-        blast_output = StringIO(result.stdout)
-        blast_df = pd.read_csv(blast_output, header=None, names=[
-            'query_id', 'subject_id', '%_identity', 'alignment_len', 'mismatches', 'gap_opens', 
-            'query_start', 'query_end', 'subject_start', 'subject_end', 'e_value', 'bit_score'
-        ], sep='\t')
-        return blast_df
+        if lease is not None:
+            blast_command += ["-num_threads", str(lease.cpu_slots)]
+        if deadline is not None and deadline.cancelled():
+            raise BlastCancelled("BLAST search was cancelled")
+        try:
+            # A new session puts blastn in its own process group so it can be killed as a whole.
+            proc = subprocess.Popen(blast_command, stdout=subprocess.PIPE, stderr=subprocess.PIPE, text=True,
+                                    start_new_session=True)
+        except OSError as exc:
+            raise BlastError(f"Could not start blastn: {exc}") from exc
+        if lease is not None:
+            try:
+                lease.apply_limits(proc.pid)
+            except OSError as exc:
+                # Never leave a child running outside the scheduler's budget.
+                self._kill_process_group(proc)
+                proc.stdout.close()
+                proc.stderr.close()
+                raise BlastError(f"Could not apply resource limits to blastn: {exc}") from exc
+
+        stdout_lines, stderr_chunks = [], []
+        readers = [
+            threading.Thread(target=lambda: stdout_lines.extend(iter(proc.stdout.readline, "")), daemon=True),
+            threading.Thread(target=lambda: stderr_chunks.append(proc.stderr.read()), daemon=True),
+        ]
+        for reader in readers:
+            reader.start()
+
+        stopped = None
+        while True:
+            try:
+                proc.wait(timeout=self.poll_interval)
+                break
+            except subprocess.TimeoutExpired:
+                if deadline is None:
+                    continue
+                if deadline.cancelled():
+                    stopped = "cancelled"
+                elif deadline.expired():
+                    stopped = "timeout"
+                if stopped:
+                    self._kill_process_group(proc)
+                    break
+        for reader in readers:
+            reader.join()
+        stderr = "".join(stderr_chunks).strip()
+
+        if stopped == "cancelled":
+            raise BlastCancelled("BLAST search was cancelled")
+        if stopped == "timeout":
+            if not self.allow_partial:
+                raise BlastTimeout("BLAST search exceeded its deadline")
+            self.partial = True
+        elif proc.returncode != 0:
+            raise BlastError(f"blastn exited with status {proc.returncode}: {stderr or 'no error output'}")
+        return self.parse_blast_output(stdout_lines)
     
     def has_exact_match(self, blast_df, seq_len):
         """
@@ -147,34 +350,65 @@ class Matcher:
         """
         return blast_df[blast_df["avg_identity"] >= self.high_prob_threshold]
     
-    def match(self, query_file):
+    def score(self, blast_df, seq_len, query_len):
         """
-        Perform the full matching pipeline:
-        - Run BLAST
+        Classify an existing BLAST hit table:
         - Check for exact matches
-        - If none, compute and return high-confidence matches
+        - If none, rank subjects by coverage-weighted identity and return
+          those whose identity over covered bases passes the threshold
 
         Args:
-            query_file (str): Path to query FASTA file.
+            blast_df (pd.DataFrame): BLAST results.
+            seq_len (int): Length of the first query record.
+            query_len (int): Total length of all query records.
 
         Returns:
             tuple:
                 - bool: True if exact match found, else False
                 - list of tuples: [(subject_id, identity), ...]
         """
-        blast_df = self.blast(query_file)
-        seq_len = self.get_sequence_len(query_file)
         if self.has_exact_match(blast_df, seq_len):
             matches = self.get_exact_matches(blast_df, seq_len)
             match_ids = matches['subject_id'].values
             match_probs = matches['%_identity'].values
             return True, list(zip(match_ids, match_probs))
         else:
-            agg_identities = self.aggregate_identities(blast_df)
-            high_probs = self.filter_high_prob_hits(agg_identities)
+            scored = self.score_coverage(blast_df, query_len)
+            high_probs = self.filter_high_prob_hits(scored)
             match_ids = high_probs['subject_id'].values
             match_probs = high_probs['avg_identity'].values
             return False, list(zip(match_ids, match_probs))
+
+    def match(self, query_file, deadline=None):
+        """
+        Perform the full matching pipeline: run BLAST, then score the hits.
+        The hit table and query lengths are kept on ``self.hits``,
+        ``self.seq_len`` and ``self.query_len`` for archiving.
+
+        If a digest index is configured and every query record is an exact copy
+        of a reference record, those references are returned as exact matches
+        without running BLAST (``self.hits`` stays None).
+
+        Args:
+            query_file (str): Path to query FASTA file.
+            deadline (Deadline): Optional deadline/cancellation for the BLAST search.
+
+        Returns:
+            tuple:
+                - bool: True if exact match found, else False
+                - list of tuples: [(subject_id, identity), ...]
+        """
+        self.partial = False
+        self.hits = None
+        if self.digest_index is not None:
+            subject_ids = self.digest_index.lookup(query_file)
+            if subject_ids:
+                return True, [(subject_id, 100.0) for subject_id in subject_ids]
+
+        self.hits = self.blast(query_file, deadline)
+        self.seq_len = self.get_sequence_len(query_file)
+        self.query_len = self.get_total_sequence_len(query_file)
+        return self.score(self.hits, self.seq_len, self.query_len)
     
 
 if __name__ == "__main__":
@@ -1,4 +1,5 @@
 from models import db, Bacteria, Phages, BacteriaInteraction, PhageInteraction, BacteriaPhages
+from matcher.host_range import get_host_range_index
 
 def get_phages_from_bacteria(bacteria_id):
     """
@@ -50,3 +51,26 @@ def get_bacteria_from_phage(phage_id):
     """
     link = BacteriaPhages.query.filter_by(phage_id=phage_id).first()
     return link.bacteria_id if link else None
+
+def get_hosts_from_phage(phage_id, min_strength="strong"):
+    """
+    Return every bacteria the phage infects at or above ``min_strength``,
+    using the in-memory host-range index.
+
+    Returns:
+        list[dict]: [{bacteria_id, infection_type}, ...]
+    """
+    index = get_host_range_index()
+    return [
+        {"bacteria_id": bacteria_id, "infection_type": strength}
+        for bacteria_id, strength in index.hosts_of_phage(phage_id, min_strength)
+    ]
+
+def get_shared_phages(bacteria_a, bacteria_b, min_strength="strong"):
+    """
+    Return UUIDs of phages that infect both bacteria at or above ``min_strength``.
+
+    Returns:
+        list[str]
+    """
+    return get_host_range_index().shared_phages(bacteria_a, bacteria_b, min_strength)
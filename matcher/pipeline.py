@@ -0,0 +1,166 @@
+import os
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+from Bio import SeqIO
+
+from matcher.deadline import Deadline
+from matcher.matcher import Matcher
+
+
+def compute_sequence_stats(query_file):
+    """
+    Basic assembly statistics for a FASTA file.
+
+    Args:
+        query_file (str): Path to the query FASTA file.
+
+    Returns:
+        dict: {genome_length, gc_content (% of unambiguous bases), n_contigs, n50}
+    """
+    lengths = []
+    gc = acgt = 0
+    for record in SeqIO.parse(query_file, "fasta"):
+        seq = str(record.seq).upper()
+        lengths.append(len(seq))
+        g_c = seq.count("G") + seq.count("C")
+        gc += g_c
+        acgt += g_c + seq.count("A") + seq.count("T")
+
+    total = sum(lengths)
+    n50 = 0
+    running = 0
+    for length in sorted(lengths, reverse=True):
+        running += length
+        if running * 2 >= total:
+            n50 = length
+            break
+    return {
+        "genome_length": total,
+        "gc_content": 100.0 * gc / acgt if acgt else 0.0,
+        "n_contigs": len(lengths),
+        "n50": n50,
+    }
+
+
+class ResistanceScreener:
+    """
+    Screens a query against a local nucleotide BLAST database of resistance
+    genes (e.g. ResFinder or CARD sequences, one gene per subject).
+    """
+
+    def __init__(self, ref_db, min_identity=90.0, min_alignment_len=100, scheduler=None):
+        """
+        Args:
+            ref_db (str): Path to the resistance gene BLAST database.
+            min_identity (float): Minimum % identity for a gene hit.
+            min_alignment_len (int): Minimum alignment length for a gene hit.
+            scheduler (BlastScheduler): Optional admission control for blastn processes.
+        """
+        self.matcher = Matcher(ref_db=ref_db, scheduler=scheduler)
+        self.min_identity = min_identity
+        self.min_alignment_len = min_alignment_len
+
+    @staticmethod
+    def is_available(ref_db):
+        return any(os.path.exists(f"{ref_db}.{ext}") for ext in ("nin", "nal"))
+
+    def screen(self, query_file, deadline=None):
+        """
+        Return resistance genes found in the query, best bit score first.
+
+        Returns:
+            list[str]: Subject ids of the matched genes.
+        """
+        blast_df = self.matcher.blast(query_file, deadline)
+        hits = blast_df[
+            (blast_df["%_identity"] >= self.min_identity) &
+            (blast_df["alignment_len"] >= self.min_alignment_len)
+        ]
+        best = hits.sort_values("bit_score", ascending=False).drop_duplicates("subject_id")
+        return list(best["subject_id"])
+
+
+class PipelineResult:
+    """
+    Outputs of one pipeline run: per-stage ``results``, ``errors`` and
+    ``timings`` (seconds), plus the overall ``wall_time``.
+    """
+
+    def __init__(self):
+        self.results = {}
+        self.errors = {}
+        self.timings = {}
+        self.wall_time = 0.0
+
+
+class AnalysisPipeline:
+    """
+    Runs the species search, resistance screen and sequence statistics for an
+    upload concurrently, so the wall-clock time is roughly that of the slowest
+    stage. The species stage is required: if it fails, the other stages are
+    cancelled and its exception is re-raised. Failures of optional stages are
+    recorded in ``PipelineResult.errors``.
+    """
+
+    REQUIRED_STAGE = "species"
+
+    def __init__(self, matcher, resistance_screener=None):
+        """
+        Args:
+            matcher (Matcher): Species matcher.
+            resistance_screener (ResistanceScreener): Optional resistance gene screen.
+        """
+        self.matcher = matcher
+        self.resistance_screener = resistance_screener
+
+    def _stages(self, query_file, deadline):
+        stages = {
+            "species": lambda: self.matcher.match(query_file, deadline),
+            "stats": lambda: compute_sequence_stats(query_file),
+        }
+        if self.resistance_screener is not None:
+            stages["resistance"] = lambda: self.resistance_screener.screen(query_file, deadline)
+        return stages
+
+    @staticmethod
+    def _timed(fn):
+        started = time.perf_counter()
+        try:
+            return fn(), None, time.perf_counter() - started
+        except Exception as exc:
+            return None, exc, time.perf_counter() - started
+
+    def run(self, query_file, deadline=None):
+        """
+        Run all stages for the query.
+
+        Args:
+            query_file (str): Path to the query FASTA file.
+            deadline (Deadline): Optional deadline shared by all BLAST stages.
+
+        Returns:
+            PipelineResult
+        """
+        deadline = deadline or Deadline()
+        stages = self._stages(query_file, deadline)
+        result = PipelineResult()
+        started = time.perf_counter()
+
+        with ThreadPoolExecutor(max_workers=len(stages)) as pool:
+            futures = {name: pool.submit(self._timed, fn) for name, fn in stages.items()}
+            value, error, elapsed = futures[self.REQUIRED_STAGE].result()
+            if error is not None:
+                deadline.cancel()
+            for name, future in futures.items():
+                value, error, elapsed = future.result()
+                result.timings[name] = elapsed
+                if error is None:
+                    result.results[name] = value
+                else:
+                    result.errors[name] = error
+
+        result.wall_time = time.perf_counter() - started
+        if self.REQUIRED_STAGE in result.errors:
+            raise result.errors[self.REQUIRED_STAGE]
+        return result
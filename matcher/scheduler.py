@@ -0,0 +1,286 @@
+import json
+import os
+import threading
+import time
+import uuid
+from contextlib import contextmanager
+
+from matcher.errors import BlastCancelled
+
+try:
+    import fcntl
+except ImportError:  # pragma: no cover - non-POSIX hosts
+    fcntl = None
+
+try:
+    import resource
+except ImportError:  # pragma: no cover - non-POSIX hosts
+    resource = None
+
+MB = 1024 * 1024
+
+
+class SchedulerBusy(Exception):
+    """
+    Raised when a BLAST search cannot be admitted, either because the wait
+    queue is full or because no slot freed up before the timeout.
+    """
+
+    def __init__(self, message, retry_after):
+        super().__init__(message)
+        self.retry_after = retry_after
+
+
+class BlastLease:
+    """
+    A granted slot for one blastn process. Call ``apply_limits(pid)`` right
+    after spawning the child to renice it and cap its address space; this is
+    done from the parent because ``preexec_fn`` is unsafe in threaded processes.
+    """
+
+    def __init__(self, token, cpu_slots, estimated_rss, address_space_limit, nice, wait_time):
+        self.token = token
+        self.cpu_slots = cpu_slots
+        self.estimated_rss = estimated_rss
+        self.address_space_limit = address_space_limit
+        self.nice = nice
+        self.wait_time = wait_time
+
+    def apply_limits(self, pid):
+        try:
+            if self.nice and hasattr(os, "setpriority"):
+                current = os.getpriority(os.PRIO_PROCESS, 0)
+                os.setpriority(os.PRIO_PROCESS, pid, min(current + self.nice, 19))
+            if self.address_space_limit and hasattr(resource, "prlimit"):
+                # Raising the hard limit needs privileges, so stay within the inherited one.
+                limit = self.address_space_limit
+                hard = resource.prlimit(pid, resource.RLIMIT_AS)[1]
+                if hard != resource.RLIM_INFINITY:
+                    limit = min(limit, hard)
+                resource.prlimit(pid, resource.RLIMIT_AS, (limit, limit))
+        except ProcessLookupError:
+            # The child already exited.
+            pass
+
+
+class BlastScheduler:
+    """
+    Admission control for concurrent blastn processes.
+
+    Searches are admitted in FIFO order while both the CPU-slot budget and the
+    estimated-RSS budget have room. State lives in a small JSON ledger guarded
+    by ``flock`` inside ``state_dir``, so every web worker sharing that
+    directory shares the same budget.
+    """
+
+    LEDGER = "blast_ledger.json"
+    LOCK = "blast_ledger.lock"
+
+    def __init__(self, state_dir, cpu_slots=None, memory_budget=4096 * MB, max_queue=8,
+                 queue_timeout=60, threads_per_search=1, nice=10, as_headroom=2.0,
+                 base_rss=256 * MB, query_rss_factor=32, poll_interval=0.25):
+        """
+        Args:
+            state_dir (str): Directory shared by all workers for the ledger.
+            cpu_slots (int): Total CPU slots across all running searches.
+            memory_budget (int): Total estimated RSS (bytes) across running searches.
+            max_queue (int): Maximum number of waiting searches before rejecting.
+            queue_timeout (float): Seconds a search may wait for a slot.
+            threads_per_search (int): CPU slots (and ``-num_threads``) per search.
+            nice (int): Niceness increment applied to the blastn child.
+            as_headroom (float): ``RLIMIT_AS`` as a multiple of the RSS estimate,
+                or 0 to disable the limit.
+            base_rss (int): Fixed per-process RSS estimate (bytes).
+            query_rss_factor (int): Estimated RSS bytes per query byte.
+            poll_interval (float): Seconds between admission attempts.
+        """
+        self.state_dir = state_dir
+        self.cpu_slots = max(1, cpu_slots or os.cpu_count() or 1)
+        self.memory_budget = memory_budget
+        self.max_queue = max_queue
+        self.queue_timeout = queue_timeout
+        self.threads_per_search = max(1, min(threads_per_search, self.cpu_slots))
+        self.nice = nice
+        self.as_headroom = as_headroom
+        self.base_rss = base_rss
+        self.query_rss_factor = query_rss_factor
+        self.poll_interval = poll_interval
+        self._local_lock = threading.Lock()
+        os.makedirs(state_dir, exist_ok=True)
+
+    @staticmethod
+    def get_db_size(ref_db):
+        """
+        Total size in bytes of the BLAST database volume files for ``ref_db``.
+        """
+        directory, prefix = os.path.split(ref_db)
+        directory = directory or "."
+        try:
+            names = os.listdir(directory)
+        except OSError:
+            return 0
+        return sum(
+            os.path.getsize(os.path.join(directory, name))
+            for name in names
+            if name.startswith(prefix + ".")
+        )
+
+    def estimate_rss(self, query_file, ref_db):
+        """
+        Estimate the peak RSS (bytes) of a blastn search, never exceeding the budget
+        so that an oversized search can still run on its own.
+        """
+        query_size = os.path.getsize(query_file) if os.path.exists(query_file) else 0
+        estimate = self.base_rss + self.get_db_size(ref_db) + query_size * self.query_rss_factor
+        return min(estimate, self.memory_budget)
+
+    @contextmanager
+    def _ledger(self):
+        """
+        Yield the ledger dict under an exclusive lock and write it back afterwards.
+        """
+        path = os.path.join(self.state_dir, self.LEDGER)
+        with self._local_lock, open(os.path.join(self.state_dir, self.LOCK), "a") as lock_file:
+            if fcntl is not None:
+                fcntl.flock(lock_file, fcntl.LOCK_EX)
+            try:
+                try:
+                    with open(path) as f:
+                        ledger = json.load(f)
+                except (OSError, ValueError):
+                    ledger = {}
+                ledger.setdefault("running", {})
+                ledger.setdefault("queued", {})
+                ledger.setdefault("waits", {"count": 0, "total": 0.0, "last": 0.0})
+                self._prune(ledger)
+                try:
+                    yield ledger
+                finally:
+                    tmp_path = f"{path}.{os.getpid()}.tmp"
+                    with open(tmp_path, "w") as f:
+                        json.dump(ledger, f)
+                    os.replace(tmp_path, path)
+            finally:
+                if fcntl is not None:
+                    fcntl.flock(lock_file, fcntl.LOCK_UN)
+
+    @staticmethod
+    def _pid_alive(pid):
+        try:
+            os.kill(pid, 0)
+        except ProcessLookupError:
+            return False
+        except PermissionError:
+            return True
+        return True
+
+    def _prune(self, ledger):
+        """
+        Drop entries left behind by workers that died without releasing them.
+        """
+        for section in ("running", "queued"):
+            for token, entry in list(ledger[section].items()):
+                if not self._pid_alive(entry["pid"]):
+                    del ledger[section][token]
+
+    def _fits(self, ledger, entry):
+        running = ledger["running"].values()
+        used_slots = sum(e["cpu_slots"] for e in running)
+        used_rss = sum(e["rss"] for e in running)
+        return (used_slots + entry["cpu_slots"] <= self.cpu_slots
+                and used_rss + entry["rss"] <= self.memory_budget)
+
+    def _retry_after(self, ledger):
+        """
+        Rough Retry-After (seconds): average wait scaled by the queue length.
+        """
+        waits = ledger["waits"]
+        avg_wait = waits["total"] / waits["count"] if waits["count"] else self.poll_interval
+        return max(1, int(avg_wait * (len(ledger["queued"]) + 1)))
+
+    @contextmanager
+    def acquire(self, query_file, ref_db, timeout=None, deadline=None):
+        """
+        Wait for a slot for one blastn search and hold it for the ``with`` block.
+
+        Args:
+            query_file (str): Path to the query FASTA file.
+            ref_db (str): Path to the reference BLAST database.
+            timeout (float): Maximum seconds to wait; defaults to ``queue_timeout``.
+            deadline (Deadline): Optional deadline whose cancellation ends the wait.
+
+        Yields:
+            BlastLease: The granted slot.
+
+        Raises:
+            SchedulerBusy: If the queue is full or the wait times out.
+            BlastCancelled: If the deadline is cancelled while queued.
+        """
+        timeout = self.queue_timeout if timeout is None else min(timeout, self.queue_timeout)
+        rss = self.estimate_rss(query_file, ref_db)
+        token = uuid.uuid4().hex
+        entry = {
+            "pid": os.getpid(),
+            "cpu_slots": self.threads_per_search,
+            "rss": rss,
+            "enqueued": time.time(),
+        }
+
+        with self._ledger() as ledger:
+            if len(ledger["queued"]) >= self.max_queue:
+                raise SchedulerBusy("BLAST queue is full", self._retry_after(ledger))
+            ledger["queued"][token] = entry
+
+        started = time.monotonic()
+        admitted = False
+        try:
+            while True:
+                with self._ledger() as ledger:
+                    head = min(ledger["queued"], key=lambda t: ledger["queued"][t]["enqueued"], default=None)
+                    if head == token and self._fits(ledger, entry):
+                        wait_time = time.monotonic() - started
+                        del ledger["queued"][token]
+                        ledger["running"][token] = dict(entry, started=time.time())
+                        ledger["waits"]["count"] += 1
+                        ledger["waits"]["total"] += wait_time
+                        ledger["waits"]["last"] = wait_time
+                        admitted = True
+                        break
+                    if deadline is not None and deadline.cancelled():
+                        del ledger["queued"][token]
+                        raise BlastCancelled("BLAST search was cancelled while queued")
+                    if time.monotonic() - started >= timeout:
+                        retry_after = self._retry_after(ledger)
+                        del ledger["queued"][token]
+                        raise SchedulerBusy("Timed out waiting for a BLAST slot", retry_after)
+                time.sleep(self.poll_interval)
+
+            limit = int(rss * self.as_headroom) if self.as_headroom else None
+            yield BlastLease(token, entry["cpu_slots"], rss, limit, self.nice, wait_time)
+        finally:
+            with self._ledger() as ledger:
+                ledger["running" if admitted else "queued"].pop(token, None)
+
+    def stats(self):
+        """
+        Snapshot of the shared scheduler state.
+
+        Returns:
+            dict: running/queued counts, used budgets and wait times (seconds).
+        """
+        with self._ledger() as ledger:
+            now = time.time()
+            running = ledger["running"].values()
+            queued = ledger["queued"].values()
+            waits = ledger["waits"]
+            return {
+                "running": len(ledger["running"]),
+                "queued": len(ledger["queued"]),
+                "cpu_slots_used": sum(e["cpu_slots"] for e in running),
+                "cpu_slots_total": self.cpu_slots,
+                "memory_reserved_mb": sum(e["rss"] for e in running) // MB,
+                "memory_budget_mb": self.memory_budget // MB,
+                "oldest_queued_wait": max((now - e["enqueued"] for e in queued), default=0.0),
+                "last_wait": waits["last"],
+                "avg_wait": waits["total"] / waits["count"] if waits["count"] else 0.0,
+            }
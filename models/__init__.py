@@ -1,6 +1,8 @@
 from flask_sqlalchemy import SQLAlchemy
 
-db = SQLAlchemy()
+from .routing import RoutingSession
+
+db = SQLAlchemy(session_options={"class_": RoutingSession})
 
 from .user import User
-from .quintx import *
\ No newline at end of file
+from .quintx import *
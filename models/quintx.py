@@ -106,6 +106,11 @@ class PhageInteraction(db.Model):
 # ---------------------
 class CaseReport(db.Model):
     __tablename__ = 'case_reports'
+    __table_args__ = (
+        db.Index('ix_case_reports_created_id', 'created_at', 'id'),
+        db.Index('ix_case_reports_user_created_id', 'user_id', 'created_at', 'id'),
+        db.Index('ix_case_reports_name_created_id', 'name', 'created_at', 'id'),
+    )
 
     id = db.Column(db.Integer, primary_key=True)
     user_id = db.Column(db.Integer, db.ForeignKey('users.id'), nullable=False)
@@ -127,6 +132,7 @@ class CaseReport(db.Model):
 
     pdf_filename = db.Column(db.String(255))
     pdf_path = db.Column(db.String(255))
+    hit_archive_path = db.Column(db.String(255))
     created_at = db.Column(db.DateTime, default=datetime.utcnow)
 
     user = db.relationship('User', back_populates='case_reports')
@@ -149,3 +155,23 @@ class PhageMatch(db.Model):
     recommended = db.Column(db.Boolean, default=False)
 
     case_report = db.relationship('CaseReport', back_populates='phage_matches')
+
+# ---------------------
+# 6. Case History Rollups
+# ---------------------
+class CaseOrganismWeekly(db.Model):
+    __tablename__ = 'case_organism_weekly'
+
+    organism = db.Column(db.String(255), primary_key=True)
+    week_start = db.Column(db.Date, primary_key=True)
+    match_type = db.Column(db.String(50), primary_key=True)
+    case_count = db.Column(db.Integer, nullable=False, default=0)
+
+
+class PhageRecommendationStat(db.Model):
+    __tablename__ = 'phage_recommendation_stats'
+
+    phage_name = db.Column(db.String(100), primary_key=True)
+    top_count = db.Column(db.Integer, nullable=False, default=0)
+    recommended_count = db.Column(db.Integer, nullable=False, default=0)
+    match_count = db.Column(db.Integer, nullable=False, default=0)
@@ -0,0 +1,66 @@
+import sqlalchemy as sa
+from flask_sqlalchemy.session import Session
+
+REPLICA_BIND = "replica"
+
+# Reference data that only changes when seeding runs.
+CATALOG_TABLES = frozenset({
+    "bacteria",
+    "phages",
+    "manufacturers",
+    "bacteria_phages",
+    "phages_manufacturers",
+    "bacteria_interactions",
+    "phage_interactions",
+})
+
+
+def _from_tables(from_clause):
+    if isinstance(from_clause, sa.Join):
+        yield from _from_tables(from_clause.left)
+        yield from _from_tables(from_clause.right)
+    else:
+        # Subqueries and aliases yield a non-Table, which keeps the read on the primary.
+        yield from_clause
+
+
+def _is_catalog_read(clause):
+    if not isinstance(clause, sa.Select):
+        return False
+    froms = clause.get_final_froms()
+    return bool(froms) and all(
+        isinstance(table, sa.Table) and table.name in CATALOG_TABLES
+        for from_clause in froms
+        for table in _from_tables(from_clause)
+    )
+
+
+class RoutingSession(Session):
+    """
+    Sends SELECTs that only touch catalog tables to the ``replica`` bind when
+    one is configured. Everything else, and every read in a transaction that
+    has already written, goes to the primary.
+    """
+
+    def get_bind(self, mapper=None, clause=None, bind=None, **kwargs):
+        if (
+            bind is None
+            and not self.info.get("wrote")
+            and not (self.new or self.dirty or self.deleted)
+            and _is_catalog_read(clause)
+        ):
+            engines = self._db.engines
+            if REPLICA_BIND in engines:
+                return engines[REPLICA_BIND]
+        return super().get_bind(mapper=mapper, clause=clause, bind=bind, **kwargs)
+
+
+@sa.event.listens_for(RoutingSession, "after_flush")
+def _mark_wrote(session, flush_context):
+    session.info["wrote"] = True
+
+
+@sa.event.listens_for(RoutingSession, "after_commit")
+@sa.event.listens_for(RoutingSession, "after_rollback")
+def _clear_wrote(session):
+    session.info.pop("wrote", None)
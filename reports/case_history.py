@@ -0,0 +1,234 @@
+import base64
+import binascii
+import json
+from datetime import datetime, timedelta
+
+from sqlalchemy import and_, case as sql_case, func, or_
+from sqlalchemy.exc import IntegrityError
+
+from models import db, CaseReport, PhageMatch, CaseOrganismWeekly, PhageRecommendationStat
+
+EXACT = "100%"
+PARTIAL = "Partial"
+
+
+class InvalidCursor(ValueError):
+    """Raised when a pagination cursor cannot be decoded."""
+
+
+def case_match_type(case):
+    return EXACT if case.matches_100 else PARTIAL
+
+
+def case_organism(case):
+    return case.name or "Unknown"
+
+
+def week_start(moment):
+    """
+    Monday of the week containing ``moment``.
+    """
+    day = moment.date() if isinstance(moment, datetime) else moment
+    return day - timedelta(days=day.weekday())
+
+
+def encode_cursor(case):
+    raw = json.dumps([case.created_at.isoformat(), case.id]).encode()
+    return base64.urlsafe_b64encode(raw).decode()
+
+
+def decode_cursor(cursor):
+    """
+    Returns:
+        tuple: (created_at, id) of the last case on the previous page.
+    """
+    try:
+        created_at, case_id = json.loads(base64.urlsafe_b64decode(cursor.encode()))
+        return datetime.fromisoformat(created_at), int(case_id)
+    except (binascii.Error, ValueError, TypeError) as exc:
+        raise InvalidCursor(f"Invalid cursor: {cursor!r}") from exc
+
+
+def serialize_case(case):
+    return {
+        "id": case.id,
+        "user_id": case.user_id,
+        "created_at": case.created_at.isoformat() if case.created_at else None,
+        "organism": case.name,
+        "uploaded_file_name": case.uploaded_file_name,
+        "match_type": case_match_type(case),
+        "match_score": case.match_score,
+        "most_effective_phage": case.most_effective_phage,
+    }
+
+
+def list_cases(user_id=None, organism=None, match_type=None, limit=50, cursor=None):
+    """
+    Page through case reports, newest first, using keyset pagination on
+    ``(created_at, id)`` so every page costs the same regardless of depth.
+
+    Args:
+        user_id (int): Only cases uploaded by this user.
+        organism (str): Only cases whose matched organism has this name.
+        match_type (str): "exact" or "partial".
+        limit (int): Page size.
+        cursor (str): ``next_cursor`` from the previous page.
+
+    Returns:
+        tuple:
+            - list[CaseReport]: Cases on this page
+            - str or None: Cursor for the next page, None on the last page
+    """
+    query = CaseReport.query
+    if user_id is not None:
+        query = query.filter(CaseReport.user_id == user_id)
+    if organism:
+        query = query.filter(CaseReport.name == organism)
+    if match_type == "exact":
+        query = query.filter(CaseReport.matches_100 == 1)
+    elif match_type == "partial":
+        query = query.filter(or_(CaseReport.matches_100 == 0, CaseReport.matches_100.is_(None)))
+    if cursor:
+        created_at, case_id = decode_cursor(cursor)
+        query = query.filter(or_(
+            CaseReport.created_at < created_at,
+            and_(CaseReport.created_at == created_at, CaseReport.id < case_id)
+        ))
+
+    cases = (
+        query.order_by(CaseReport.created_at.desc(), CaseReport.id.desc())
+        .limit(limit + 1)
+        .all()
+    )
+    next_cursor = encode_cursor(cases[limit - 1]) if len(cases) > limit else None
+    return cases[:limit], next_cursor
+
+
+def _increment(model, key, **deltas):
+    """
+    Add ``deltas`` to the rollup row identified by ``key``, creating it if needed.
+    """
+    values = {getattr(model, column): getattr(model, column) + delta for column, delta in deltas.items()}
+    if model.query.filter_by(**key).update(values, synchronize_session=False):
+        return
+    try:
+        with db.session.begin_nested():
+            db.session.add(model(**key, **deltas))
+    except IntegrityError:
+        # Another worker inserted the row first.
+        model.query.filter_by(**key).update(values, synchronize_session=False)
+
+
+def record_case_rollups(case, phage_matches, sign=1):
+    """
+    Fold a new case into the summary tables. Call before committing the case
+    so the rollups commit (or roll back) with it.
+
+    To change an existing case, call this with ``sign=-1`` before modifying it
+    and again with the default sign afterwards.
+
+    Args:
+        case (CaseReport): The flushed case report.
+        phage_matches (list[PhageMatch]): Phage matches saved with the case.
+        sign (int): 1 to add the case to the rollups, -1 to take it back out.
+    """
+    _increment(
+        CaseOrganismWeekly,
+        {"organism": case_organism(case), "week_start": week_start(case.created_at), "match_type": case_match_type(case)},
+        case_count=sign
+    )
+    counts = {}
+    for match in phage_matches:
+        if not match.phage_name:
+            continue
+        entry = counts.setdefault(match.phage_name, {"top_count": 0, "recommended_count": 0, "match_count": 0})
+        entry["match_count"] += 1
+        entry["recommended_count"] += 1 if match.recommended else 0
+    if case.most_effective_phage in counts:
+        counts[case.most_effective_phage]["top_count"] += 1
+    for phage_name, deltas in counts.items():
+        _increment(PhageRecommendationStat, {"phage_name": phage_name},
+                   **{column: sign * delta for column, delta in deltas.items()})
+
+
+def rebuild_case_rollups():
+    """
+    Recompute the summary tables from the full case history, e.g. to backfill
+    cases created before the rollups existed.
+    """
+    CaseOrganismWeekly.query.delete()
+    PhageRecommendationStat.query.delete()
+
+    weekly = {}
+    for case in CaseReport.query.yield_per(1000):
+        key = (case_organism(case), week_start(case.created_at), case_match_type(case))
+        weekly[key] = weekly.get(key, 0) + 1
+    db.session.add_all(
+        CaseOrganismWeekly(organism=organism, week_start=week, match_type=match_type, case_count=count)
+        for (organism, week, match_type), count in weekly.items()
+    )
+
+    top_counts = dict(
+        db.session.query(CaseReport.most_effective_phage, func.count(CaseReport.id))
+        .group_by(CaseReport.most_effective_phage)
+        .all()
+    )
+    for phage_name, match_count, recommended_count in (
+        db.session.query(PhageMatch.phage_name, func.count(PhageMatch.id),
+                         func.sum(sql_case((PhageMatch.recommended.is_(True), 1), else_=0)))
+        .filter(PhageMatch.phage_name.isnot(None))
+        .group_by(PhageMatch.phage_name)
+        .all()
+    ):
+        db.session.add(PhageRecommendationStat(
+            phage_name=phage_name,
+            top_count=top_counts.get(phage_name, 0),
+            recommended_count=recommended_count or 0,
+            match_count=match_count
+        ))
+    db.session.commit()
+
+
+def organism_weekly_summary(since=None, organism=None):
+    """
+    Cases per organism per week from the rollup table.
+
+    Returns:
+        list[dict]: [{organism, week_start, match_type, case_count}, ...]
+    """
+    # Rows emptied by re-scoring stay behind with a zero count.
+    query = CaseOrganismWeekly.query.filter(CaseOrganismWeekly.case_count > 0)
+    if since is not None:
+        query = query.filter(CaseOrganismWeekly.week_start >= week_start(since))
+    if organism:
+        query = query.filter(CaseOrganismWeekly.organism == organism)
+    return [
+        {
+            "organism": row.organism,
+            "week_start": row.week_start.isoformat(),
+            "match_type": row.match_type,
+            "case_count": row.case_count,
+        }
+        for row in query.order_by(CaseOrganismWeekly.week_start.desc(), CaseOrganismWeekly.organism).all()
+    ]
+
+
+def phage_recommendation_summary(phage_name=None, limit=50):
+    """
+    How often each phage was the top recommendation, recommended at all, or matched.
+
+    Returns:
+        list[dict]: [{phage_name, top_count, recommended_count, match_count}, ...]
+    """
+    query = PhageRecommendationStat.query
+    if phage_name:
+        query = query.filter(PhageRecommendationStat.phage_name == phage_name)
+    return [
+        {
+            "phage_name": row.phage_name,
+            "top_count": row.top_count,
+            "recommended_count": row.recommended_count,
+            "match_count": row.match_count,
+        }
+        for row in query.order_by(PhageRecommendationStat.top_count.desc()).limit(limit).all()
+    ]
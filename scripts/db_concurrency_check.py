@@ -0,0 +1,140 @@
+"""
+Concurrency check for the case-report write path.
+
+Starts N processes that each commit cases the same way ``upload()`` does
+(CaseReport + PhageMatch rows + rollup updates) against one database, then
+reports throughput, commit latency and lock waits.
+
+    python -m scripts.db_concurrency_check --processes 8 --cases 100 \
+        --database-url sqlite:////tmp/concurrency.db
+"""
+import argparse
+import multiprocessing
+import os
+import statistics
+import tempfile
+import time
+from datetime import datetime
+
+from flask import Flask
+from sqlalchemy.exc import OperationalError
+
+from config import configure_database
+from models import db, User, CaseReport, PhageMatch
+from reports.case_history import record_case_rollups
+
+LOCK_ERRORS = ("database is locked", "could not obtain lock", "deadlock detected", "lock wait timeout")
+
+
+def create_app(database_url, statement_timeout_ms):
+    app = Flask(__name__)
+    app.config['SQLALCHEMY_DATABASE_URI'] = database_url
+    app.config['SQLALCHEMY_TRACK_MODIFICATIONS'] = False
+    app.config['DATABASE_STATEMENT_TIMEOUT_MS'] = statement_timeout_ms
+    configure_database(app)
+    db.init_app(app)
+    return app
+
+
+def _is_lock_error(exc):
+    message = str(exc).lower()
+    return any(marker in message for marker in LOCK_ERRORS)
+
+
+def _write_cases(args):
+    worker, database_url, n_cases, statement_timeout_ms, start_at = args
+    app = create_app(database_url, statement_timeout_ms)
+    latencies, lock_errors, lock_wait = [], 0, 0.0
+    with app.app_context():
+        db.engine.dispose()
+        # Start all workers together so they actually contend.
+        time.sleep(max(0.0, start_at - time.time()))
+        for i in range(n_cases):
+            started = time.perf_counter()
+            while True:
+                try:
+                    case = CaseReport(
+                        user_id=1,
+                        uploaded_file_name=f"worker{worker}_{i}.fasta",
+                        name=f"Organism {i % 5}",
+                        most_effective_phage=f"Phage {i % 7}",
+                        match_score=99.0,
+                        matches_100=i % 2,
+                        matches_partial=1 - i % 2,
+                        created_at=datetime.utcnow()
+                    )
+                    db.session.add(case)
+                    db.session.flush()
+                    phage_matches = [
+                        PhageMatch(case_report_id=case.id, phage_name=f"Phage {(i + k) % 7}", recommended=bool(i % 2))
+                        for k in range(3)
+                    ]
+                    db.session.add_all(phage_matches)
+                    record_case_rollups(case, phage_matches)
+                    db.session.commit()
+                    break
+                except OperationalError as exc:
+                    db.session.rollback()
+                    if not _is_lock_error(exc):
+                        raise
+                    lock_errors += 1
+            elapsed = time.perf_counter() - started
+            latencies.append(elapsed)
+        # Time beyond the fastest commit approximates time spent waiting on locks.
+        fastest = min(latencies) if latencies else 0.0
+        lock_wait = sum(latency - fastest for latency in latencies)
+    return latencies, lock_errors, lock_wait
+
+
+def run(database_url, processes, cases_per_process, statement_timeout_ms):
+    """
+    Run the check and return a summary dict.
+    """
+    app = create_app(database_url, statement_timeout_ms)
+    with app.app_context():
+        db.create_all()
+        if not db.session.get(User, 1):
+            db.session.add(User(id=1, email="concurrency@example.com", name="Concurrency Check", is_active=True))
+            db.session.commit()
+        db.engine.dispose()
+
+    start_at = time.time() + 1.0
+    jobs = [(w, database_url, cases_per_process, statement_timeout_ms, start_at) for w in range(processes)]
+    with multiprocessing.get_context("spawn").Pool(processes) as pool:
+        results = pool.map(_write_cases, jobs)
+    wall_time = time.time() - start_at
+
+    latencies = sorted(latency for worker_latencies, _, _ in results for latency in worker_latencies)
+    total = len(latencies)
+    return {
+        "processes": processes,
+        "cases": total,
+        "wall_time_s": round(wall_time, 3),
+        "throughput_cases_per_s": round(total / wall_time, 1) if wall_time > 0 else None,
+        "commit_p50_ms": round(statistics.median(latencies) * 1000, 2) if latencies else None,
+        "commit_p95_ms": round(latencies[int(0.95 * (total - 1))] * 1000, 2) if latencies else None,
+        "commit_max_ms": round(latencies[-1] * 1000, 2) if latencies else None,
+        "lock_errors": sum(errors for _, errors, _ in results),
+        "lock_wait_s": round(sum(wait for _, _, wait in results), 3),
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--processes", type=int, default=4)
+    parser.add_argument("--cases", type=int, default=50, help="Cases committed by each process.")
+    parser.add_argument("--database-url", default=os.environ.get("DATABASE_URL"),
+                        help="Defaults to $DATABASE_URL or a temporary SQLite file.")
+    parser.add_argument("--statement-timeout-ms", type=int, default=30000)
+    args = parser.parse_args()
+
+    database_url = args.database_url
+    if not database_url:
+        database_url = "sqlite:///" + os.path.join(tempfile.mkdtemp(), "concurrency.db")
+    summary = run(database_url, args.processes, args.cases, args.statement_timeout_ms)
+    for key, value in summary.items():
+        print(f"{key:>24}: {value}")
+
+
+if __name__ == "__main__":
+    main()